@@ -1,82 +1,223 @@
+import asyncio
+import logging
+import math
+import random
+import threading
 import time
-from datetime import datetime, timedelta
-from typing import List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
 
 from onelogin.api.models.user import User
 from onelogin.api.models.otp_device import OTP_Device
 from onelogin.api.models.factor_enrollment_response import FactorEnrollmentResponse
 from onelogin.api.client import OneLoginClient
 
-from .exceptions import FactorNotFound, OneLoginClientError, APIResponseError, UserNotFound, FactorNotFound, TimeOutError
+from .cache import TTLCache
+from .exceptions import FactorNotFound, OneLoginClientError, APIResponseError, UserNotFound, TimeOutError, AuthenticationCancelled, InvalidConfiguration
+
+
+logger = logging.getLogger(__name__)
+
+_authenticators = {}
+_authenticators_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+_USER_NOT_FOUND = object()
+
+
+class PollSettings(NamedTuple):
+    initial: float = 0.5     # seconds
+    multiplier: float = 1.5
+    max_delay: float = 5.0   # seconds
+    timeout: float = 60.0    # seconds
+
+
+def _validate_poll_settings(settings: PollSettings) -> None:
+    if settings.initial <= 0:
+        raise InvalidConfiguration(f"Push poll initial delay must be positive: {settings.initial}")
+    if settings.multiplier < 1:
+        raise InvalidConfiguration(f"Push poll multiplier must be at least 1: {settings.multiplier}")
+    if settings.max_delay < settings.initial:
+        raise InvalidConfiguration(f"Push poll max delay must not be less than the initial delay: {settings.max_delay}")
+    if settings.timeout <= 0:
+        raise InvalidConfiguration(f"Push timeout must be positive: {settings.timeout}")
+
+
+def _poll_delays(settings: PollSettings) -> Iterator[float]:
+    delay = settings.initial
+    deadline = time.monotonic() + settings.timeout
+    while time.monotonic() < deadline:
+        delay = min(delay, settings.max_delay)
+        yield delay + random.uniform(0, delay * 0.1)
+        delay *= settings.multiplier
+
+
+def _get_client(client_id: str, client_secret: str, region: str) -> Tuple[OneLoginClient, threading.Lock]:
+    key = (client_id, client_secret, region)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = (OneLoginClient(client_id, client_secret, region), threading.Lock())
+            _clients[key] = client
+        return client
 
 
 class Authenticator:
-    PUSH_VERIFICATION_POLL_FREQUENCY = 5  # seconds
-    PUSH_VERIFICATION_POLL_TIMEOUT = 60   # seconds
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60                   # seconds
+    USER_NOT_FOUND_CACHE_TTL = 10         # seconds
+    FACTOR_CACHE_SIZE = 1024
+    FACTOR_CACHE_TTL = 30                 # seconds
+    IO_POOL_SIZE = 4
+    PREFETCH_CACHE_SIZE = 1024
+    PREFETCH_POOL_SIZE = 2
+    PREFETCH_QUEUE_LIMIT = 16
 
-    def __init__(self, client_id: str, client_secret: str, region: str = "us", user_attribute: str = "username"):
+    def __init__(self, client_id: str, client_secret: str, region: str = "us", user_attribute: str = "username", poll_settings: PollSettings = PollSettings()):
         self._client_id = client_id
         self._client_secret = client_secret
         self._region = region
         self._user_attribute = user_attribute
+        _validate_poll_settings(poll_settings)
+        self._poll_settings = poll_settings
+        self._user_query_template = {self._user_attribute: None, "fields": "id"}
+        self._user_cache = TTLCache(maxsize=self.USER_CACHE_SIZE, ttl=self.USER_CACHE_TTL)
+        self._factor_cache = TTLCache(maxsize=self.FACTOR_CACHE_SIZE, ttl=self.FACTOR_CACHE_TTL)
+
+        self._client, self._client_lock = _get_client(self._client_id, self._client_secret, self._region)
+        if self._client.access_token is None:
+            self._verify_client()
+
+        self._io_pool = ThreadPoolExecutor(max_workers=self.IO_POOL_SIZE)
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=self.PREFETCH_POOL_SIZE)
+        self._prefetch_slots = threading.BoundedSemaphore(self.PREFETCH_QUEUE_LIMIT)
+        self._prefetches = TTLCache(maxsize=self.PREFETCH_CACHE_SIZE, ttl=self.FACTOR_CACHE_TTL)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="onelogin-push", daemon=True).start()
 
-        self._client = OneLoginClient(self._client_id, self._client_secret, self._region)
-        self._verify_client()
+    @classmethod
+    def get_or_create(cls, client_id: str, client_secret: str, region: str = "us", user_attribute: str = "username", poll_settings: PollSettings = PollSettings()) -> "Authenticator":
+        key = (client_id, client_secret, region, user_attribute, poll_settings)
+        with _authenticators_lock:
+            authenticator = _authenticators.get(key)
+            if authenticator is None:
+                authenticator = cls(client_id, client_secret, region=region, user_attribute=user_attribute, poll_settings=poll_settings)
+                _authenticators[key] = authenticator
+            return authenticator
+
+    def _call_client(self, method: Callable, *args, **kwargs) -> Tuple[Any, Optional[str], Optional[str]]:
+        # The client keeps the last error as instance state, so read it under the same lock as the call.
+        with self._client_lock:
+            result = method(*args, **kwargs)
+            return result, self._client.error, self._client.error_description
 
     def _verify_client(self) -> None:
-        if self._client.get_access_token() is None:
-            raise OneLoginClientError(self._client.error_description)
+        token, _, error_description = self._call_client(self._client.get_access_token)
+        if token is None:
+            raise OneLoginClientError(error_description)
 
     def _get_user(self, username: str) -> User:
-        query_params = {self._user_attribute: username, "fields": "id"}
-        users = self._client.get_users(query_params)
-        if users is None:
-            raise APIResponseError(self._client.error_description)
+        cache_key = (self._user_attribute, username)
+        user = self._user_cache.get(cache_key)
+        if user is _USER_NOT_FOUND:
+            raise UserNotFound(f"No user found for user: {username} based on attribute: {self._user_attribute}")
+        elif user is not None:
+            return user
+        query_params = self._user_query_template.copy()
+        query_params[self._user_attribute] = username
+        users, error, error_description = self._call_client(self._client.get_users, query_params)
+        if users is None or error is not None:
+            raise APIResponseError(error_description)
         elif len(users) > 1:
             raise APIResponseError(f"More than one user found for user: {username} based on attribute: {self._user_attribute}")
         elif len(users) < 1:
+            self._user_cache.set(cache_key, _USER_NOT_FOUND, ttl=self.USER_NOT_FOUND_CACHE_TTL)
             raise UserNotFound(f"No user found for user: {username} based on attribute: {self._user_attribute}")
-        return users.pop()
+        user = users[0]
+        self._user_cache.set(cache_key, user)
+        return user
+
+    def _enrolled_factors_by_id(self, user_id: int) -> List[OTP_Device]:
+        factors = self._factor_cache.get(user_id)
+        if factors is not None:
+            return factors
+        factors, error, error_description = self._call_client(self._client.get_enrolled_factors, user_id)
+        if factors is None or error is not None:
+            raise APIResponseError(error_description)
+        self._factor_cache.set(user_id, factors)
+        return factors
 
-    def _get_default_factor(self, username: str) -> OTP_Device:
-        factors = self.get_enrolled_factors(username)
+    def _get_default_factor(self, user_id: int) -> OTP_Device:
+        factors = self._enrolled_factors_by_id(user_id)
         default_factor = next((factor for factor in factors if factor.default), None)
         if default_factor is None:
             raise FactorNotFound("No default MFA factor found")
         return default_factor
 
     def _activate_factor(self, user_id: int, factor_id: int, expires_in: Optional[int] = None) -> FactorEnrollmentResponse:
-        response = self._client.activate_factor(user_id, factor_id, expires_in=expires_in)
+        response, _, error_description = self._call_client(self._client.activate_factor, user_id, factor_id, expires_in=expires_in)
         if response is None:
-            raise APIResponseError(self._client.error_description)
+            raise APIResponseError(error_description)
         return response
 
-    def get_enrolled_factors(self, username: str) -> List[OTP_Device]:
+    def _fetch_enrolled_factors(self, username: str) -> List[OTP_Device]:
         user = self._get_user(username)
-        factors = self._client.get_enrolled_factors(user.id)
-        if factors is None:
-            raise APIResponseError(self._client.error_description)
-        return factors
+        return self._enrolled_factors_by_id(user.id)
+
+    def _wait_for_prefetch(self, username: str) -> None:
+        future = self._prefetches.get(username)
+        if future is not None:
+            wait((future,))
+
+    def get_enrolled_factors(self, username: str) -> List[OTP_Device]:
+        self._wait_for_prefetch(username)
+        return self._fetch_enrolled_factors(username)
+
+    def _prefetch_done(self, future: Future) -> None:
+        self._prefetch_slots.release()
+        if future.exception() is not None:
+            logger.debug(f"Prefetching enrolled factors failed: {future.exception()}")
+
+    def prefetch_enrolled_factors(self, username: str) -> None:
+        pending = self._prefetches.get(username)
+        if pending is not None and not pending.done():
+            return
+        if not self._prefetch_slots.acquire(blocking=False):
+            logger.debug(f"Skipping enrolled factors prefetch for user={username}, too many prefetches pending")
+            return
+        future = self._prefetch_pool.submit(self._fetch_enrolled_factors, username)
+        future.add_done_callback(self._prefetch_done)
+        self._prefetches.set(username, future)
 
     def otp_authenticate(self, username: str, otp: str, factor_id: Optional[int] = None) -> bool:
+        self._wait_for_prefetch(username)
         user = self._get_user(username)
-        factor_id = factor_id or self._get_default_factor(username).id
-        return self._client.verify_factor(user.id, factor_id, otp)
+        factor_id = factor_id or self._get_default_factor(user.id).id
+        verified, _, _ = self._call_client(self._client.verify_factor, user.id, factor_id, otp)
+        return verified
 
-    def push_authenticate(self, username: str, factor_id: Optional[int] = None) -> bool:
-        user = self._get_user(username)
-        factor_id = factor_id or self._get_default_factor(username).id
-        activation = self._activate_factor(user.id, factor_id, expires_in=self.PUSH_VERIFICATION_POLL_TIMEOUT)
-        expires_at = datetime.now() + timedelta(seconds=self.PUSH_VERIFICATION_POLL_TIMEOUT)
-        while expires_at > datetime.now():
-            response = self._client.verify_factor_poll(user.id, activation.id)
-            if response.status == "pending":
-                time.sleep(self.PUSH_VERIFICATION_POLL_FREQUENCY)
-                continue
-            elif response.status == "accepted":
+    def push_authenticate(self, username: str, factor_id: Optional[int] = None, cancel_check: Optional[Callable[[], bool]] = None) -> bool:
+        coroutine = self.push_authenticate_async(username, factor_id=factor_id, cancel_check=cancel_check)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def push_authenticate_async(self, username: str, factor_id: Optional[int] = None, cancel_check: Optional[Callable[[], bool]] = None) -> bool:
+        loop = asyncio.get_event_loop()
+        prefetch = self._prefetches.get(username)
+        if prefetch is not None:
+            await asyncio.wait((asyncio.wrap_future(prefetch),))
+        user = await loop.run_in_executor(self._io_pool, self._get_user, username)
+        factor_id = factor_id or (await loop.run_in_executor(self._io_pool, self._get_default_factor, user.id)).id
+        expires_in = math.ceil(self._poll_settings.timeout)
+        activation = await loop.run_in_executor(self._io_pool, self._activate_factor, user.id, factor_id, expires_in)
+        for delay in _poll_delays(self._poll_settings):
+            response, _, _ = await loop.run_in_executor(self._io_pool, self._call_client, self._client.verify_factor_poll, user.id, activation.id)
+            if response.status == "accepted":
                 return True
             elif response.status == "rejected":
                 return False
-            else:
+            elif response.status != "pending":
                 raise APIResponseError(f"Push verification status not recognized: {response.status}")
+            if cancel_check is not None and cancel_check():
+                raise AuthenticationCancelled("Push verification cancelled")
+            await asyncio.sleep(delay)
         raise TimeOutError("Push verification timed out")
\ No newline at end of file
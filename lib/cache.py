@@ -0,0 +1,36 @@
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self._maxsize:
+                self._evict()
+            self._entries[key] = (value, time.monotonic() + (self._ttl if ttl is None else ttl))
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key, (_, expires_at) in list(self._entries.items()):
+            if expires_at <= now:
+                del self._entries[key]
+        while len(self._entries) >= self._maxsize:
+            del self._entries[next(iter(self._entries))]
@@ -19,4 +19,12 @@ class TimeOutError(PluginError):
 
 
 class APIResponseError(PluginError):
-    pass
\ No newline at end of file
+    pass
+
+
+class AuthenticationCancelled(PluginError):
+    pass
+
+
+class InvalidConfiguration(PluginError):
+    pass
@@ -1,14 +1,14 @@
-from typing import List, Optional
+from typing import Optional, Tuple
 
 from safeguard.sessions.plugin import AAPlugin, AAResponse
 from safeguard.sessions.plugin.plugin_base import cookie_property
 
-from lib.authenticator import Authenticator
-from lib.exceptions import FactorNotFound
+from lib.authenticator import Authenticator, PollSettings
+from lib.exceptions import FactorNotFound, UserNotFound
 
 
 class Plugin(AAPlugin):
-    FACTOR_SELECTION_SUPPORTED_PROTOCOLS = ["ssh", "telnet"]
+    FACTOR_SELECTION_SUPPORTED_PROTOCOLS = frozenset({"ssh", "telnet"})
 
     def __init__(self, configuration):
         super().__init__(configuration)
@@ -20,7 +20,15 @@ class Plugin(AAPlugin):
         region = self.plugin_configuration.get("onelogin", "api_region", default="us")
         user_attribute = self.plugin_configuration.get("onelogin", "user_attribute", default="username")
 
-        self._authenticator = Authenticator(client_id, client_secret, region=region, user_attribute=user_attribute)
+        default_poll_settings = PollSettings()
+        poll_settings = PollSettings(
+            initial=self.plugin_configuration.getfloat("onelogin", "push_poll_initial_delay", default=default_poll_settings.initial),
+            multiplier=self.plugin_configuration.getfloat("onelogin", "push_poll_multiplier", default=default_poll_settings.multiplier),
+            max_delay=self.plugin_configuration.getfloat("onelogin", "push_poll_max_delay", default=default_poll_settings.max_delay),
+            timeout=self.plugin_configuration.getfloat("onelogin", "push_timeout", default=default_poll_settings.timeout),
+        )
+
+        self._authenticator = Authenticator.get_or_create(client_id, client_secret, region=region, user_attribute=user_attribute, poll_settings=poll_settings)
 
         self._factor_selection_enabled = self.plugin_configuration.getboolean("onelogin", "enable_factor_selection", default=True)
         self._enable_stacktrace = self.plugin_configuration.getboolean("logging", "enable_stacktrace", default=False)
@@ -32,8 +40,12 @@ class Plugin(AAPlugin):
         return False
 
     @cookie_property
-    def _enrolled_factors(self) -> List[tuple]:
-        return list()
+    def _enrolled_factor_ids(self) -> Tuple[int, ...]:
+        return tuple()
+
+    @cookie_property
+    def _enrolled_factor_names(self) -> Tuple[str, ...]:
+        return tuple()
 
     @cookie_property
     def _user_selected_factor_id(self) -> Optional[int]:
@@ -45,12 +57,15 @@ class Plugin(AAPlugin):
 
     @property
     def _factor_selection_prompt(self) -> str:
-        prompt = ""
-        for position, factor in enumerate(self._enrolled_factors, start=1):
-            factor_display_name = factor[1]
-            prompt += f"{position}) {factor_display_name}\n"
-        prompt += "Select a factor: "
-        return prompt
+        return "".join(
+            f"{position}) {name}\n" for position, name in enumerate(self._enrolled_factor_names, start=1)
+        ) + "Select a factor: "
+
+    def _ask_mfa_password(self):
+        response = super()._ask_mfa_password()
+        if response is not None:
+            self._authenticator.prefetch_enrolled_factors(self.mfa_identity)
+        return response
 
     def _init_factor_selection(self) -> AAResponse:
         self.logger.debug("Initializing factor selection")
@@ -58,21 +73,23 @@ class Plugin(AAPlugin):
         if not enrolled_factors:
             self.logger.info("No factors are available to select from")
             return AAResponse.deny(deny_reason="No factors found")
-        self._enrolled_factors = [(f.id, f.user_display_name) for f in enrolled_factors]
+        self._enrolled_factor_ids = tuple(f.id for f in enrolled_factors)
+        self._enrolled_factor_names = tuple(f.user_display_name for f in enrolled_factors)
         self._factor_selection_in_progress = True
-        self.logger.debug(f"Factor selection initialized with factors={self._enrolled_factors}")
+        self.logger.debug(f"Factor selection initialized with factors={self._enrolled_factor_ids}")
         return AAResponse.need_info(self._factor_selection_prompt, "user_factor_selection")
 
     def _finish_factor_selection(self) -> AAResponse:
         self.logger.info("Finishing factor selection")
         self._factor_selection_in_progress = False
+        self._enrolled_factor_names = tuple()
         try:
             selection = self.connection.key_value_pairs.get("user_factor_selection", None)
             self.logger.debug(f"User selection received={selection or str('none')}")
             index = int(selection)-1
             if index < 0:
                 raise ValueError
-            self._user_selected_factor_id = self._enrolled_factors[index][0]
+            self._user_selected_factor_id = self._enrolled_factor_ids[index]
         except (ValueError, TypeError, IndexError):
             return AAResponse.deny(deny_reason="Invalid selection")
         self.connection.key_value_pairs.pop("otp")
@@ -93,23 +110,27 @@ class Plugin(AAPlugin):
         try:
             if self._factor_selection_in_progress:
                 return self._finish_factor_selection()
-            if self.mfa_password:
-                if self.mfa_password == "!select":
+            mfa_identity = self.mfa_identity
+            mfa_password = self.mfa_password
+            if mfa_password:
+                if mfa_password == "!select":
                     return self._run_factor_selection_command()
-                if self._authenticator.otp_authenticate(self.mfa_identity, self.mfa_password, factor_id=self._user_selected_factor_id):
+                if self._authenticator.otp_authenticate(mfa_identity, mfa_password, factor_id=self._user_selected_factor_id):
                     self.logger.info("OTP authentication successful")
                     return AAResponse.accept(reason="OTP authentication successful")
                 else:
                     self.logger.info("OTP authentication failed")
                     return AAResponse.deny(deny_reason="OTP authentication failed")
             else:
-                self.logger.info(f"Running push authentication for user={self.mfa_identity} with factor={self._user_selected_factor_id or str('default')}")
-                if self._authenticator.push_authenticate(self.mfa_identity, factor_id=self._user_selected_factor_id):
+                self.logger.info(f"Running push authentication for user={mfa_identity} with factor={self._user_selected_factor_id or str('default')}")
+                if self._authenticator.push_authenticate(mfa_identity, factor_id=self._user_selected_factor_id):
                     self.logger.info("Push verification accepted by user")
                     return AAResponse.accept(reason="Push verification successful")
                 else:
                     self.logger.info("Push verification rejected by user")
                     return AAResponse.deny(deny_reason="Push verification failed")
+        except (UserNotFound, FactorNotFound) as e:
+            self.logger.info(e)
         except Exception as e:
             self.logger.error(e, exc_info=self._enable_stacktrace)
         return AAResponse.deny(deny_reason="An error occured")
\ No newline at end of file
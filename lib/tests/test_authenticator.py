@@ -0,0 +1,219 @@
+import asyncio
+import collections
+import logging
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from lib import authenticator
+from lib.authenticator import Authenticator, PollSettings, _poll_delays
+from lib.exceptions import AuthenticationCancelled, APIResponseError, InvalidConfiguration, OneLoginClientError, UserNotFound
+
+
+FAST_POLL_SETTINGS = PollSettings(initial=0.01, multiplier=1.0, max_delay=0.01, timeout=5.0)
+
+
+class FakeOneLoginClient:
+    def __init__(self, client_id, client_secret, region):
+        self.access_token = None
+        self.error = None
+        self.error_description = None
+        self.calls = collections.Counter()
+        self.activations = set()
+        self.concurrent_pushes = 1
+        self.polls = {}
+
+    def get_access_token(self):
+        self.access_token = "token"
+        return self.access_token
+
+    def get_users(self, query_parameters):
+        self.calls["get_users"] += 1
+        self.error = None
+        if query_parameters["username"] == "nobody":
+            return []
+        return [SimpleNamespace(id=hash(query_parameters["username"]))]
+
+    def get_enrolled_factors(self, user_id):
+        self.calls["get_enrolled_factors"] += 1
+        return [SimpleNamespace(id=1, default=True, user_display_name="OneLogin Protect")]
+
+    def activate_factor(self, user_id, factor_id, expires_in=None):
+        self.activations.add(user_id)
+        return SimpleNamespace(id=user_id)
+
+    def verify_factor_poll(self, user_id, verification_id):
+        self.polls[verification_id] = self.polls.get(verification_id, 0) + 1
+        accepted = self.polls[verification_id] >= 3 and len(self.activations) >= self.concurrent_pushes
+        return SimpleNamespace(status="accepted" if accepted else "pending")
+
+    def verify_factor(self, user_id, device_id, otp_token=None):
+        self.calls["verify_factor"] += 1
+        return otp_token == "123456"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(authenticator.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def onelogin_client():
+    with mock.patch.object(authenticator, "OneLoginClient", FakeOneLoginClient), \
+            mock.patch.dict(authenticator._clients, clear=True):
+        yield
+
+
+def test_concurrent_push_authentications(onelogin_client):
+    auth = Authenticator("client_id", "client_secret", poll_settings=FAST_POLL_SETTINGS)
+    auth._client.concurrent_pushes = 2
+    results = {}
+
+    def push(username):
+        try:
+            results[username] = auth.push_authenticate(username)
+        except Exception as e:
+            results[username] = e
+
+    threads = [threading.Thread(target=push, args=(username,)) for username in ("alice", "bob")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"alice": True, "bob": True}
+
+
+def test_user_is_looked_up_once(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+    assert auth._get_user("alice") is auth._get_user("alice")
+    assert auth.otp_authenticate("alice", "123456", factor_id=1)
+    assert auth._client.calls["get_users"] == 1
+
+
+def test_default_factor_lookup_does_not_resolve_user_again(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+    assert auth.otp_authenticate("alice", "123456")
+    assert auth._client.calls == {"get_users": 1, "get_enrolled_factors": 1, "verify_factor": 1}
+
+
+def test_enrolled_factors_are_cached(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+    assert auth.get_enrolled_factors("alice") is auth.get_enrolled_factors("alice")
+    assert auth.otp_authenticate("alice", "123456")
+    assert auth._client.calls["get_enrolled_factors"] == 1
+
+
+def test_single_push_authentication(onelogin_client):
+    auth = Authenticator("client_id", "client_secret", poll_settings=FAST_POLL_SETTINGS)
+    assert auth.push_authenticate("alice")
+
+
+def test_unknown_user_is_cached(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+    for _ in range(2):
+        with pytest.raises(UserNotFound):
+            auth._get_user("nobody")
+    assert auth._client.calls["get_users"] == 1
+
+
+def test_failed_user_lookup_is_not_cached(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+
+    def rate_limited(query_parameters):
+        auth._client.calls["get_users"] += 1
+        auth._client.error = "429"
+        return []
+
+    with mock.patch.object(auth._client, "get_users", rate_limited):
+        with pytest.raises(APIResponseError):
+            auth._get_user("alice")
+    assert auth._get_user("alice").id == hash("alice")
+    assert auth._client.calls["get_users"] == 2
+
+
+def test_client_calls_hold_the_client_lock(onelogin_client):
+    auth = Authenticator("client_id", "client_secret")
+
+    def failing_call():
+        assert auth._client_lock.locked()
+        auth._client.error = "500"
+        auth._client.error_description = "Internal error"
+
+    assert auth._call_client(failing_call) == (None, "500", "Internal error")
+
+
+def test_prefetch_is_skipped_while_one_is_pending(onelogin_client, monkeypatch):
+    monkeypatch.setattr(Authenticator, "PREFETCH_QUEUE_LIMIT", 2)
+    auth = Authenticator("client_id", "client_secret")
+    release = threading.Event()
+    get_users = auth._client.get_users
+    monkeypatch.setattr(auth._client, "get_users", lambda query_parameters: release.wait(5) and get_users(query_parameters))
+
+    auth.prefetch_enrolled_factors("alice")
+    auth.prefetch_enrolled_factors("alice")
+    auth.prefetch_enrolled_factors("bob")
+    auth.prefetch_enrolled_factors("carol")
+    release.set()
+
+    assert auth.get_enrolled_factors("alice")
+    assert auth.get_enrolled_factors("bob")
+    assert auth._client.calls["get_users"] == 2
+
+
+def test_failed_prefetch_is_logged(onelogin_client, caplog):
+    auth = Authenticator("client_id", "client_secret")
+    with caplog.at_level(logging.DEBUG, logger=authenticator.logger.name):
+        auth.prefetch_enrolled_factors("nobody")
+        auth._prefetch_pool.shutdown(wait=True)
+    assert "Prefetching enrolled factors failed: No user found for user: nobody" in caplog.text
+
+
+def test_push_authentication_stops_when_cancelled(onelogin_client):
+    auth = Authenticator("client_id", "client_secret", poll_settings=FAST_POLL_SETTINGS)
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(AuthenticationCancelled):
+            loop.run_until_complete(auth.push_authenticate_async("alice", cancel_check=lambda: True))
+    finally:
+        loop.close()
+    assert sum(auth._client.polls.values()) == 1
+
+
+@pytest.mark.parametrize("poll_settings", [
+    PollSettings(initial=0),
+    PollSettings(multiplier=0.5),
+    PollSettings(initial=2.0, max_delay=1.0),
+    PollSettings(timeout=0),
+])
+def test_invalid_poll_settings_are_rejected(onelogin_client, poll_settings):
+    with pytest.raises(InvalidConfiguration):
+        Authenticator("client_id", "client_secret", poll_settings=poll_settings)
+
+
+def test_failed_client_verification_starts_no_threads(onelogin_client):
+    threads_before = threading.active_count()
+    with mock.patch.object(FakeOneLoginClient, "get_access_token", return_value=None):
+        for _ in range(3):
+            with pytest.raises(OneLoginClientError):
+                Authenticator.get_or_create("client_id", "client_secret")
+    assert threading.active_count() == threads_before
+
+
+def test_poll_delays_grow_up_to_max_delay_until_deadline(clock, monkeypatch):
+    monkeypatch.setattr(authenticator.random, "uniform", lambda low, high: high)
+    delays = []
+    for delay in _poll_delays(PollSettings(initial=1.0, multiplier=2.0, max_delay=5.0, timeout=10.0)):
+        delays.append(delay)
+        clock[0] += delay
+    assert delays == pytest.approx([1.1, 2.2, 4.4, 5.5])
+
+
+def test_poll_delay_jitter_is_at_most_ten_percent(clock):
+    settings = PollSettings(initial=1.0, multiplier=1.0, max_delay=1.0, timeout=10.0)
+    for delay, _ in zip(_poll_delays(settings), range(100)):
+        assert 1.0 <= delay <= 1.1
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from lib import cache
+from lib.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_returns_default_for_missing_key(clock):
+    assert TTLCache(maxsize=2, ttl=10).get("missing", "default") == "default"
+
+
+def test_entry_expires_after_ttl(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("key", "value")
+    clock[0] += 9
+    assert ttl_cache.get("key") == "value"
+    clock[0] += 1
+    assert ttl_cache.get("key") is None
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("key", "value", ttl=1)
+    clock[0] += 1
+    assert ttl_cache.get("key") is None
+
+
+def test_expired_entries_are_evicted_first(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("old", 1)
+    ttl_cache.set("short", 2, ttl=1)
+    clock[0] += 1
+    ttl_cache.set("new", 3)
+    assert ttl_cache.get("old") == 1
+    assert ttl_cache.get("new") == 3
+
+
+def test_oldest_entry_is_evicted_when_full(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set("first", 1)
+    ttl_cache.set("second", 2)
+    ttl_cache.set("third", 3)
+    assert ttl_cache.get("first") is None
+    assert ttl_cache.get("second") == 2
+    assert ttl_cache.get("third") == 3
+
+
+def test_concurrent_writes_keep_size_bounded():
+    ttl_cache = TTLCache(maxsize=8, ttl=10)
+
+    def write(offset):
+        for i in range(1000):
+            ttl_cache.set(offset + i, i)
+
+    threads = [threading.Thread(target=write, args=(offset,)) for offset in range(0, 4000, 1000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ttl_cache._entries) <= 8